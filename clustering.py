@@ -3,103 +3,323 @@ Module phân cụm và chọn văn bản đại diện
 """
 import numpy as np
 from typing import List, Tuple, Dict
-from collections import defaultdict
+from collections import namedtuple
+
+try:
+    from numba import njit
+    NUMBA_AVAILABLE = True
+except ImportError:
+    NUMBA_AVAILABLE = False
+
+
+# Contract chung cho các cặp tương tự giữa faiss_search/simhash/minhash và
+# clustering: 3 mảng song song thay vì list tuple (i int32, j int32, score)
+Pairs = namedtuple('Pairs', ['i', 'j', 'score'])
+
+
+def as_pairs(pairs) -> Pairs:
+    """
+    Chuẩn hoá pairs về dạng Pairs (3 mảng numpy song song)
+
+    Args:
+        pairs: Pairs hoặc list các tuple (doc_id1, doc_id2, score)
+
+    Returns:
+        Pairs với i/j là int32, score giữ nguyên dtype
+    """
+    if isinstance(pairs, Pairs):
+        return pairs
+
+    n = len(pairs)
+    return Pairs(
+        i=np.fromiter((p[0] for p in pairs), dtype=np.int32, count=n),
+        j=np.fromiter((p[1] for p in pairs), dtype=np.int32, count=n),
+        score=np.fromiter((p[2] for p in pairs), dtype=np.float32, count=n),
+    )
 
 
 class UnionFind:
-    """Cấu trúc Union-Find để phân cụm"""
-    
+    """Cấu trúc Union-Find để phân cụm (path halving + union by size)"""
+
     def __init__(self, n: int):
         self.parent = list(range(n))
-        self.rank = [0] * n
-    
+        self.size = [1] * n
+
     def find(self, x: int) -> int:
-        if self.parent[x] != x:
-            self.parent[x] = self.find(self.parent[x])
-        return self.parent[x]
-    
+        # Path halving: một vòng lặp duy nhất, không đệ quy
+        parent = self.parent
+        while parent[x] != x:
+            parent[x] = parent[parent[x]]
+            x = parent[x]
+        return x
+
     def union(self, x: int, y: int):
         px, py = self.find(x), self.find(y)
         if px == py:
             return
-        if self.rank[px] < self.rank[py]:
+        # Union by size: gắn cây nhỏ vào cây lớn
+        if self.size[px] < self.size[py]:
             px, py = py, px
         self.parent[py] = px
-        if self.rank[px] == self.rank[py]:
-            self.rank[px] += 1
+        self.size[px] += self.size[py]
+
+
+def _union_find_build(n: int, pairs_i: np.ndarray, pairs_j: np.ndarray) -> np.ndarray:
+    """
+    Chạy toàn bộ union trên mảng parent/size int32 (path halving + union by size)
+
+    Args:
+        n: Tổng số văn bản
+        pairs_i, pairs_j: Hai cột doc_id của các cặp tương tự (int32)
+
+    Returns:
+        Mảng parent sau khi union hết các cặp
+    """
+    parent = np.arange(n, dtype=np.int32)
+    size = np.ones(n, dtype=np.int32)
+
+    for k in range(len(pairs_i)):
+        x = pairs_i[k]
+        y = pairs_j[k]
+
+        while parent[x] != x:
+            parent[x] = parent[parent[x]]
+            x = parent[x]
+        while parent[y] != y:
+            parent[y] = parent[parent[y]]
+            y = parent[y]
+
+        if x == y:
+            continue
+        if size[x] < size[y]:
+            x, y = y, x
+        parent[y] = x
+        size[x] += size[y]
+
+    return parent
+
+
+if NUMBA_AVAILABLE:
+    # Biên dịch hot loop thành native code, loại bỏ Python dispatch cho từng cặp
+    _union_find_build = njit(cache=True)(_union_find_build)
 
 
 def cluster_documents(
-    pairs: List[Tuple[int, int, float]],
+    pairs,
     n_docs: int
 ) -> Dict[int, List[int]]:
     """
     Phân cụm dựa trên các cặp tương tự
-    
+
     Args:
-        pairs: List các cặp (doc_id1, doc_id2, similarity)
+        pairs: Pairs hoặc list các cặp (doc_id1, doc_id2, similarity)
         n_docs: Tổng số văn bản
-    
+
     Returns:
         Dict {cluster_root: [doc_ids]}
     """
-    uf = UnionFind(n_docs)
-    
-    for i, j, _ in pairs:
-        uf.union(i, j)
-    
-    clusters = defaultdict(list)
-    for doc_id in range(n_docs):
-        root = uf.find(doc_id)
-        clusters[root].append(doc_id)
-    
+    pairs = as_pairs(pairs)
+    parent = _union_find_build(n_docs, pairs.i, pairs.j)
+
+    # Nén phẳng parent bằng gather vector hoá: sau path halving các chuỗi
+    # còn rất ngắn nên p = p[p] hội tụ trong vài pass, không cần truy root
+    # từng doc trong Python
+    roots = parent
+    while True:
+        next_roots = roots[roots]
+        if np.array_equal(roots, next_roots):
+            break
+        roots = next_roots
+
+    # Groupby bằng một lần argsort + scan biên thay cho defaultdict:
+    # các doc cùng root nằm liền kề sau khi sort
+    order = np.argsort(roots, kind='stable')
+    sorted_roots = roots[order]
+    boundaries = 1 + np.flatnonzero(sorted_roots[1:] != sorted_roots[:-1])
+    groups = np.split(order, boundaries)
+
     # Chỉ giữ clusters có > 1 văn bản
-    return {k: v for k, v in clusters.items() if len(v) > 1}
+    return {
+        int(roots[group[0]]): group.tolist()
+        for group in groups if len(group) > 1
+    }
+
+
+def summarize_clusters(
+    clustering_result: Dict,
+    include_documents: bool = False
+) -> Dict:
+    """
+    Rút gọn kết quả phân cụm cho response JSON của API
+
+    Full text của từng văn bản đã nằm trong báo cáo Word (endpoint
+    download riêng); gửi lại toàn bộ trong JSON vừa phình response lên
+    hàng MB vừa tốn CPU encode. Mặc định chỉ giữ size / representative /
+    doc_ids cho mỗi cụm.
+
+    Args:
+        clustering_result: Kết quả từ process_clustering
+        include_documents: True để trả cả full documents (debug)
+
+    Returns:
+        Dict cùng cấu trúc với clustering_result nhưng clusters đã rút gọn
+    """
+    clusters = clustering_result['clusters']
+
+    if include_documents:
+        clusters_summary = clusters
+    else:
+        clusters_summary = {
+            cid: {
+                'size': info['size'],
+                'representative': info['representative'],
+                'doc_ids': info['docs'],
+            }
+            for cid, info in clusters.items()
+        }
+
+    return {
+        'clusters': clusters_summary,
+        'stats': clustering_result['stats'],
+        'duplicates': clustering_result['duplicates'],
+        'kept': clustering_result['kept'],
+    }
 
 
 def select_representative(
     cluster: List[int],
     texts: List[str],
     embeddings: np.ndarray = None,
-    method: str = 'shortest'
+    method: str = 'shortest',
+    lengths: np.ndarray = None
 ) -> int:
     """
     Chọn văn bản đại diện cho cụm
-    
+
     Args:
         cluster: List doc_ids trong cụm
         texts: Danh sách tất cả văn bản
         embeddings: Embeddings (optional, cho method='centroid')
         method: 'shortest', 'longest', 'centroid'
-    
+        lengths: Mảng độ dài văn bản tính sẵn (optional); tránh gọi
+                 len(texts[i]) trong Python cho từng thành viên
+
     Returns:
         Doc ID của văn bản đại diện
     """
-    
+
     if len(cluster) == 1:
         return cluster[0]
     
     if method == 'centroid' and embeddings is not None:
-        # Chọn văn bản gần centroid nhất
+        # Chọn văn bản gần centroid nhất. Khoảng cách bình phương là đủ:
+        # sqrt đơn điệu nên argmin không đổi, einsum gộp bình phương + tổng
+        # trong một pass và không cấp phát mảng norm trung gian
         cluster_vecs = embeddings[cluster]
         centroid = np.mean(cluster_vecs, axis=0)
-        distances = np.linalg.norm(cluster_vecs - centroid, axis=1)
-        return cluster[np.argmin(distances)]
+        diff = cluster_vecs - centroid
+        d2 = np.einsum('ij,ij->i', diff, diff)
+        return cluster[int(np.argmin(d2))]
     
     elif method == 'shortest':
-        # Chọn văn bản ngắn nhất
+        # Chọn văn bản ngắn nhất: gather + argmin trên mảng độ dài
+        if lengths is not None:
+            cluster_arr = np.asarray(cluster)
+            return int(cluster_arr[np.argmin(lengths[cluster_arr])])
         return min(cluster, key=lambda i: len(texts[i]))
-    
+
     elif method == 'longest':
         # Chọn văn bản dài nhất
+        if lengths is not None:
+            cluster_arr = np.asarray(cluster)
+            return int(cluster_arr[np.argmax(lengths[cluster_arr])])
         return max(cluster, key=lambda i: len(texts[i]))
-    
+
     else:
         return cluster[0]
 
 
+def _select_representatives_by_length(
+    clusters_raw: Dict[int, List[int]],
+    lengths: np.ndarray,
+    longest: bool = False
+) -> Dict[int, int]:
+    """
+    Chọn đại diện ngắn nhất / dài nhất cho TẤT CẢ cụm trong một lượt
+
+    Args:
+        clusters_raw: Dict {cluster_root: [doc_ids]}
+        lengths: Mảng độ dài văn bản (n_docs,)
+        longest: True để chọn văn bản dài nhất thay vì ngắn nhất
+
+    Returns:
+        Dict {cluster_root: doc_id đại diện}
+    """
+    cluster_ids = list(clusters_raw.keys())
+    sizes = [len(clusters_raw[cid]) for cid in cluster_ids]
+
+    members = np.concatenate(
+        [np.asarray(clusters_raw[cid], dtype=np.int64) for cid in cluster_ids]
+    )
+    labels = np.repeat(np.arange(len(cluster_ids)), sizes)
+
+    key = lengths[members]
+    if longest:
+        key = -key
+
+    # Segment argmin: sort ổn định theo (label, key), lấy đầu mỗi segment
+    order = np.lexsort((key, labels))
+    seg_starts = np.r_[0, 1 + np.flatnonzero(np.diff(labels[order]))]
+    best_members = members[order[seg_starts]]
+
+    return {cid: int(best_members[k]) for k, cid in enumerate(cluster_ids)}
+
+
+def _select_representatives_centroid(
+    clusters_raw: Dict[int, List[int]],
+    embeddings: np.ndarray
+) -> Dict[int, int]:
+    """
+    Chọn đại diện gần centroid nhất cho TẤT CẢ cụm trong một lượt vector hoá
+    (thay vì gọi np.mean/np.linalg.norm trên từng slice nhỏ của từng cụm)
+
+    Args:
+        clusters_raw: Dict {cluster_root: [doc_ids]}
+        embeddings: Ma trận embeddings (n_docs, dim)
+
+    Returns:
+        Dict {cluster_root: doc_id đại diện}
+    """
+    cluster_ids = list(clusters_raw.keys())
+    sizes = [len(clusters_raw[cid]) for cid in cluster_ids]
+    n_clusters = len(cluster_ids)
+
+    # Gom mọi thành viên vào một mảng, label = thứ tự cụm
+    members = np.concatenate(
+        [np.asarray(clusters_raw[cid], dtype=np.int64) for cid in cluster_ids]
+    )
+    labels = np.repeat(np.arange(n_clusters), sizes)
+    vecs = embeddings[members]
+
+    # Centroid của mọi cụm trong một pass scatter-add
+    centroids = np.zeros((n_clusters, embeddings.shape[1]), dtype=np.float64)
+    np.add.at(centroids, labels, vecs)
+    centroids /= np.asarray(sizes, dtype=np.float64)[:, None]
+
+    # Khoảng cách bình phương tới centroid (không cần sqrt cho argmin)
+    diff = vecs - centroids[labels]
+    d2 = np.einsum('ij,ij->i', diff, diff)
+
+    # Segment argmin: sort theo (label, d2) rồi lấy phần tử đầu mỗi segment
+    order = np.lexsort((d2, labels))
+    seg_starts = np.r_[0, 1 + np.flatnonzero(np.diff(labels[order]))]
+    best_members = members[order[seg_starts]]
+
+    return {cid: int(best_members[k]) for k, cid in enumerate(cluster_ids)}
+
+
 def process_clustering(
-    pairs: List[Tuple[int, int, float]],
+    pairs,
     texts: List[str],
     embeddings: np.ndarray = None,
     representative_method: str = 'centroid'
@@ -122,23 +342,44 @@ def process_clustering(
         }
     """
     
+    pairs = as_pairs(pairs)
     n_docs = len(texts)
-    print(f"\nPhân cụm: {n_docs} văn bản, {len(pairs)} cặp tương tự")
+    print(f"\nPhân cụm: {n_docs} văn bản, {len(pairs.i)} cặp tương tự")
     
     # Phân cụm
     clusters_raw = cluster_documents(pairs, n_docs)
     print(f" Tìm được {len(clusters_raw)} cụm trùng lặp")
     
-    # Xử lý từng cụm
+    # Độ dài tính một lần cho cả corpus thay vì len(texts[i]) từng cụm
+    lengths = np.fromiter((len(t) for t in texts), dtype=np.int64, count=n_docs)
+
+    # Chọn đại diện: các method được vector hoá trên toàn bộ cụm
+    if (representative_method == 'centroid'
+            and embeddings is not None and clusters_raw):
+        representatives = _select_representatives_centroid(clusters_raw, embeddings)
+    elif representative_method in ('shortest', 'longest') and clusters_raw:
+        representatives = _select_representatives_by_length(
+            clusters_raw, lengths, longest=(representative_method == 'longest')
+        )
+    else:
+        representatives = None
+
+    # Xử lý từng cụm; đánh dấu văn bản trùng bằng mask bool thay vì set
     clusters_output = {}
-    all_duplicates = set()
-    
+    is_duplicate = np.zeros(n_docs, dtype=bool)
+
     for cluster_id, doc_ids in clusters_raw.items():
         # Chọn đại diện
-        representative_id = select_representative(
-            doc_ids, texts, embeddings, representative_method
-        )
-        
+        if representatives is not None:
+            representative_id = representatives[cluster_id]
+        else:
+            representative_id = select_representative(
+                doc_ids, texts, embeddings, representative_method, lengths
+            )
+
+        # Mọi thành viên cụm là duplicate trừ đại diện (clear sau vòng lặp)
+        is_duplicate[doc_ids] = True
+
         # Tạo danh sách documents cho cluster
         documents = []
         for doc_id in doc_ids:
@@ -147,19 +388,23 @@ def process_clustering(
                 'text': texts[doc_id],
                 'is_representative': (doc_id == representative_id)
             })
-            
-            if doc_id != representative_id:
-                all_duplicates.add(doc_id)
-        
+
         clusters_output[cluster_id] = {
             'docs': doc_ids,
             'representative': representative_id,
             'size': len(doc_ids),
             'documents': documents
         }
-    
+
+    if clusters_output:
+        reps = np.fromiter(
+            (c['representative'] for c in clusters_output.values()),
+            dtype=np.int64, count=len(clusters_output)
+        )
+        is_duplicate[reps] = False
+
     # Tính thống kê
-    n_removed = len(all_duplicates)
+    n_removed = int(is_duplicate.sum())
     n_kept = n_docs - n_removed
     
     stats = {
@@ -167,7 +412,7 @@ def process_clustering(
         'n_clusters': len(clusters_output),
         'n_removed': n_removed,
         'n_kept': n_kept,
-        'n_pairs': len(pairs),
+        'n_pairs': len(pairs.i),
         'removal_rate': n_removed / n_docs if n_docs > 0 else 0
     }
     
@@ -178,9 +423,10 @@ def process_clustering(
     print(f"   - Văn bản giữ lại: {stats['n_kept']}")
     print(f"   - Tỷ lệ loại: {stats['removal_rate']:.1%}")
     
+    # Chỉ đổi sang list Python tại biên trả về (JSON boundary)
     return {
         'clusters': clusters_output,  # ← Đây phải là dict
         'stats': stats,
-        'duplicates': sorted(list(all_duplicates)),
-        'kept': [i for i in range(n_docs) if i not in all_duplicates]
+        'duplicates': np.flatnonzero(is_duplicate).tolist(),
+        'kept': np.flatnonzero(~is_duplicate).tolist()
     }
@@ -1,6 +1,8 @@
 """
 Module tạo embeddings từ text sử dụng SentenceTransformers
 """
+import threading
+
 import numpy as np
 from sentence_transformers import SentenceTransformer
 import torch
@@ -9,55 +11,91 @@ import torch
 class TextEmbedder:
     """Class để tạo embeddings cho văn bản"""
     _instance = None
-    def __init__(self, model_name='all-MiniLM-L6-v2'):
+    _lock = threading.Lock()
+
+    def __new__(cls, model_name='all-MiniLM-L6-v2'):
         """
-        Khởi tạo model embedding (singleton pattern)
-        Args:
-            model_name: Tên model từ sentence-transformers
+        Singleton ngay tại __new__: lần thứ hai trở đi trả thẳng instance
+        dùng chung, không chạy lại logic device/print nào cả.
+
+        Double-checked locking: nhiều thread gọi đồng thời (các request
+        song song) chỉ một thread được load model (~trăm MB trên GPU),
+        các thread còn lại chờ rồi nhận cùng instance.
         """
-        if TextEmbedder._instance is not None:
-            self.model = TextEmbedder._instance.model
-            self.model_name = TextEmbedder._instance.model_name
-            return
-        
+        if cls._instance is not None:
+            return cls._instance
+
+        with cls._lock:
+            if cls._instance is None:
+                instance = super().__new__(cls)
+                instance._load_model(model_name)
+                cls._instance = instance
+
+        return cls._instance
+
+    def _load_model(self, model_name):
+        """Load model một lần duy nhất (chỉ gọi từ __new__ dưới lock)"""
         print(f"Đang tải model {model_name}...")
-        
+
         # Thiết lập device
         device = 'cuda' if torch.cuda.is_available() else 'cpu'
         print(f"   Device: {device}")
-        
-        self.model = SentenceTransformer(model_name, device=device)
+
+        # eval(): tắt dropout/batchnorm training mode một lần cho mọi call
+        self.model = SentenceTransformer(model_name, device=device).eval()
         self.model_name = model_name
-        
-        TextEmbedder._instance = self
-    
-    def embed_texts(self, texts, batch_size=64):
+
+
+    def embed_texts(self, texts, batch_size=64, use_fp16=False,
+                    normalize=False):
         """
         Tạo embeddings cho danh sách văn bản
-        
+
         Args:
             texts: List các văn bản (string)
             batch_size: Số văn bản xử lý mỗi lần
-        
+            use_fp16: Trả embeddings float16 (nửa bandwidth cho các bước
+                      memory-bound phía sau như emb @ planes.T của
+                      SimHash — vốn chỉ cần dấu của dot). Trên CUDA còn
+                      half() cả model để forward chạy Tensor Core; lưu ý
+                      model là singleton nên half() có hiệu lực cho các
+                      call sau đó
+            normalize: Normalize L2 ngay trong SentenceTransformer thay
+                       vì để FAISS làm sau
+
         Returns:
-            numpy array shape (n_texts, embedding_dim) - dtype float32
+            numpy array shape (n_texts, embedding_dim) - float32, hoặc
+            float16 khi use_fp16
         """
         if not texts:
             raise ValueError("Danh sách văn bản rỗng")
-        
-        
+
+
         print(f"Tạo embeddings cho {len(texts)} văn bản (batch_size={batch_size})...")
-        
-        embeddings = self.model.encode(
-            texts,
+
+        encode_kwargs = dict(
             batch_size=batch_size,
             show_progress_bar=True,
             convert_to_numpy=True,
-            normalize_embeddings=False  # Normalize sau trong FAISS
+            normalize_embeddings=normalize,
         )
-        
-        embeddings = embeddings.astype(np.float32)
-        
+        # sentence-transformers 3.0.1 không có precision='float16' —
+        # fp16 lấy bằng model.half() trên CUDA, còn trên CPU thì convert
+        # đầu ra ở bước ascontiguousarray phía dưới
+        if use_fp16 and torch.cuda.is_available():
+            self.model.half()
+
+        # inference_mode: tắt autograd tracking, encode nhả GIL trong
+        # phần forward nên các thread khác vẫn chạy được
+        with torch.inference_mode():
+            embeddings = self.model.encode(texts, **encode_kwargs)
+
+        # encode() đã trả đúng dtype trong trường hợp thường gặp — chỉ copy
+        # khi dtype/layout chưa đúng, tránh một pass thừa qua cả ma trận.
+        # Downstream (FAISS, SimHash) dựa vào contract contiguous này.
+        out_dtype = np.float16 if use_fp16 else np.float32
+        embeddings = np.ascontiguousarray(embeddings, dtype=out_dtype)
+
         print(f"Hoàn tất. Shape: {embeddings.shape}")
         return embeddings
     
@@ -66,18 +104,23 @@ class TextEmbedder:
         return self.model.get_sentence_embedding_dimension()
 
 
-def get_embeddings_from_texts(texts: list, model_name='all-MiniLM-L6-v2', batch_size=64) -> np.ndarray:
+def get_embeddings_from_texts(texts: list, model_name='all-MiniLM-L6-v2',
+                              batch_size=64, use_fp16=False,
+                              normalize=False) -> np.ndarray:
     """
     Function tiện ích để tạo embeddings từ danh sách text
-    
+
     Args:
         texts: List các văn bản string
         model_name: Tên model SentenceTransformer
         batch_size: Kích thước batch
-    
+        use_fp16: Trả embeddings float16 (xem TextEmbedder.embed_texts)
+        normalize: Normalize L2 ngay trong model
+
     Returns:
-        numpy array embeddings (float32)
+        numpy array embeddings (float32, hoặc float16 khi use_fp16)
     """
     embedder = TextEmbedder(model_name)
-    return embedder.embed_texts(texts, batch_size)
+    return embedder.embed_texts(texts, batch_size, use_fp16=use_fp16,
+                                normalize=normalize)
 
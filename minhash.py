@@ -2,9 +2,126 @@
 Module tìm kiếm trùng lặp sử dụng MinHash + LSH
 """
 import re
-from typing import List, Tuple
+from typing import List
+
+import numpy as np
 from tqdm import tqdm
-from datasketch import MinHash, MinHashLSH
+from datasketch import MinHash
+from datasketch.lsh import _optimal_param
+
+from clustering import Pairs, as_pairs
+from simhash import _candidate_pairs
+
+try:
+    from numba import njit, prange
+    NUMBA_AVAILABLE = True
+except ImportError:
+    NUMBA_AVAILABLE = False
+    prange = range
+
+# Hằng số polynomial hash cho shingle (FNV prime 64-bit)
+_SHINGLE_HASH_MULT = np.uint64(1099511628211)
+
+# Mersenne prime 2^61 - 1 cho hash family (a*h + b) mod p, như datasketch
+_MERSENNE_PRIME = np.uint64((1 << 61) - 1)
+_MAX_HASH = np.uint64((1 << 32) - 1)
+
+# Seed cố định cho các permutation để signature ổn định giữa các lần chạy
+_PERM_SEED = 1
+
+
+def _make_permutations(num_perm: int):
+    """Sinh hệ số (A, B) cho num_perm hàm băm hoán vị"""
+    rng = np.random.default_rng(_PERM_SEED)
+    # Giới hạn < 2^32 để a*h + b (h đã mask 32 bit) không tràn uint64
+    a = rng.integers(1, 1 << 32, size=num_perm, dtype=np.uint64)
+    b = rng.integers(0, 1 << 32, size=num_perm, dtype=np.uint64)
+    return a, b
+
+
+def _minhash_signatures(flat_hashes, offsets, perm_a, perm_b, num_perm):
+    """
+    Tính ma trận signature MinHash cho mọi văn bản trong một call
+
+    Args:
+        flat_hashes: Hash shingle (32 bit) của mọi doc nối liền nhau
+        offsets: offsets[d]:offsets[d+1] là đoạn hash của doc d
+        perm_a, perm_b: Hệ số hoán vị uint64
+        num_perm: Số permutation
+
+    Returns:
+        Ma trận signature (n_docs, num_perm) uint32
+    """
+    n_docs = len(offsets) - 1
+    sig = np.full((n_docs, num_perm), _MAX_HASH, dtype=np.uint32)
+
+    for d in prange(n_docs):
+        start = offsets[d]
+        end = offsets[d + 1]
+        for p in range(num_perm):
+            a = perm_a[p]
+            b = perm_b[p]
+            best = _MAX_HASH
+            # Vòng MADD + min chặt chẽ, Numba auto-vectorize được
+            for s in range(start, end):
+                v = ((a * flat_hashes[s] + b) % _MERSENNE_PRIME) & _MAX_HASH
+                if v < best:
+                    best = v
+            sig[d, p] = best
+
+    return sig
+
+
+def _verify_jaccard(signatures, pairs_i, pairs_j):
+    """
+    Ước lượng Jaccard cho cả mảng candidate pairs bằng equality-count
+
+    Đếm số permutation trùng nhau trực tiếp trên ma trận signature —
+    đúng công thức MinHash.jaccard nhưng không dispatch Python từng cặp;
+    vòng eq += (a == b) được auto-vectorize thành so sánh SIMD.
+
+    Args:
+        signatures: Ma trận signature (n_docs, num_perm) uint32
+        pairs_i, pairs_j: 2 mảng chỉ số doc song song
+
+    Returns:
+        Mảng float32: Jaccard ước lượng của từng cặp
+    """
+    n_pairs = len(pairs_i)
+    num_perm = signatures.shape[1]
+    out = np.empty(n_pairs, dtype=np.float32)
+
+    for p in prange(n_pairs):
+        eq = 0
+        for k in range(num_perm):
+            eq += signatures[pairs_i[p], k] == signatures[pairs_j[p], k]
+        out[p] = eq / num_perm
+
+    return out
+
+
+if NUMBA_AVAILABLE:
+    _minhash_signatures = njit(cache=True, parallel=True)(_minhash_signatures)
+    _verify_jaccard = njit(cache=True, parallel=True)(_verify_jaccard)
+
+
+def _band_hash(band_sig: np.ndarray) -> np.ndarray:
+    """
+    Băm mỗi hàng (rows giá trị signature) của một band thành key uint64
+
+    Polynomial hash theo cột như hash_shingles — O(rows) phép toán mảng
+    thay cho băm tuple từng doc trong Python.
+
+    Args:
+        band_sig: Lát signature (n_docs, rows) của một band
+
+    Returns:
+        Mảng key (n_docs,) uint64
+    """
+    keys = np.zeros(len(band_sig), dtype=np.uint64)
+    for col in range(band_sig.shape[1]):
+        keys = keys * _SHINGLE_HASH_MULT + band_sig[:, col]
+    return keys
 
 
 def create_shingles(text: str, k: int = 5) -> set:
@@ -26,12 +143,47 @@ def create_shingles(text: str, k: int = 5) -> set:
     
     return shingles
 
+def hash_shingles(text: str, k: int = 5) -> np.ndarray:
+    """
+    Băm tập k-shingles (theo ký tự) của text thành mảng uint64 vector hoá
+
+    Thay cho vòng lặp Python cắt text[i:i+k] từng vị trí: decode text
+    thành mảng codepoint uint32 một lần, lấy mọi cửa sổ k ký tự bằng
+    sliding_window_view (zero-copy) rồi tính polynomial hash theo cột —
+    O(k) phép toán mảng thay vì O(len * k) thao tác Python.
+
+    Args:
+        text: Văn bản đầu vào
+        k: Kích thước shingle (số ký tự)
+
+    Returns:
+        Mảng uint64 các hash shingle DUY NHẤT (đã qua np.unique)
+    """
+    # Normalize text (giống create_shingles)
+    text = re.sub(r'\s+', ' ', text.lower().strip())
+
+    # uint32 codepoint giữ đúng ngữ nghĩa shingle theo KÝ TỰ như bản cũ
+    codes = np.frombuffer(text.encode('utf-32-le'), dtype=np.uint32)
+
+    if len(codes) < k:
+        windows = codes.reshape(1, -1)
+    else:
+        windows = np.lib.stride_tricks.sliding_window_view(codes, k)
+
+    hashes = np.zeros(len(windows), dtype=np.uint64)
+    for col in range(windows.shape[1]):
+        # Overflow uint64 wrap quanh 2^64 — đúng ý cho polynomial hash
+        hashes = hashes * _SHINGLE_HASH_MULT + windows[:, col]
+
+    return np.unique(hashes)
+
+
 def find_duplicates_minhash(
     texts: List[str],
     num_perm: int = 128,
     jaccard_threshold: float = 0.5,
     k_shingles: int = 5
-) -> List[Tuple[int, int, float]]:
+) -> Pairs:
     """
     Tìm các cặp văn bản tương tự sử dụng MinHash + LSH
     Args:
@@ -40,12 +192,12 @@ def find_duplicates_minhash(
         jaccard_threshold: Ngưỡng Jaccard similarity
         k_shingles: Kích thước k-shingles
     Returns:
-        List các tuple (doc_id_1, doc_id_2, jaccard_similarity)
+        Pairs (i int32, j int32, score float32 = jaccard_similarity)
     """
-    
+
     if not texts or len(texts) < 2:
         print("Danh sách văn bản không hợp lệ")
-        return []
+        return as_pairs([])
     
     n_docs = len(texts)
     print(f"MinHash: Xử lý {n_docs} văn bản (num_perm={num_perm}, k={k_shingles})")
@@ -53,47 +205,88 @@ def find_duplicates_minhash(
     # Bước 1: Tạo MinHash cho mỗi văn bản
     print("Bước 1: Tạo MinHash signatures...")
     minhashes = []
+    signatures = None
+
+    if NUMBA_AVAILABLE:
+        # Đường nhanh: dồn hash shingle của mọi doc vào một mảng phẳng
+        # (SoA + offsets) rồi tính cả ma trận signature trong một kernel
+        # Numba — thay cho num_perm * n_shingles lần update() qua Python.
+        # Banding lẫn verify đều làm việc thẳng trên ma trận signature
+        # nên không cần bọc lại thành đối tượng MinHash.
+        doc_hashes = [
+            hash_shingles(text, k=k_shingles).astype(np.uint64) & _MAX_HASH
+            for text in tqdm(texts, desc="   Shingle")
+        ]
+        offsets = np.zeros(n_docs + 1, dtype=np.int64)
+        np.cumsum([len(h) for h in doc_hashes], out=offsets[1:])
+        flat_hashes = np.concatenate(doc_hashes)
+
+        perm_a, perm_b = _make_permutations(num_perm)
+        signatures = _minhash_signatures(
+            flat_hashes, offsets, perm_a, perm_b, num_perm
+        )
+    else:
+        for idx, text in enumerate(tqdm(texts, desc="   MinHash")):
+            # Shingle đã được băm vector hoá thành uint64; chỉ còn bước
+            # update MinHash đi qua Python
+            shingle_hashes = hash_shingles(text, k=k_shingles)
+
+            m = MinHash(num_perm=num_perm)
+            for hash_value in shingle_hashes:
+                m.update(hash_value.tobytes())
+
+            minhashes.append(m)
     
-    for idx, text in enumerate(tqdm(texts, desc="   MinHash")):
-        shingles = create_shingles(text, k=k_shingles)
-        
-        m = MinHash(num_perm=num_perm)
-        for shingle in shingles:
-            m.update(shingle.encode('utf-8'))
-        
-        minhashes.append(m)
-    
-    # Bước 2: LSH để tìm candidates
+    # Bước 2: LSH banding vector hoá trực tiếp trên ma trận signature —
+    # thay cho MinHashLSH.insert/query (dict lookup per doc per band).
+    # Chia band/row theo đúng công thức optimal của datasketch, băm mỗi
+    # band thành key uint64 rồi groupby bằng sort-and-scan dùng CHUNG
+    # _band_buckets với SimHash.
     print("Bước 2: LSH to find candidate pairs...")
-    lsh = MinHashLSH(threshold=jaccard_threshold, num_perm=num_perm)
-    
-    for idx, m in enumerate(minhashes):
-        lsh.insert(f"doc_{idx}", m)
-    
-    # Bước 3: Tìm candidate pairs
-    candidate_pairs = set()
-    for idx, m in enumerate(minhashes):
-        candidates = lsh.query(m)
-        for candidate_id in candidates:
-            candidate_idx = int(candidate_id.split('_')[1])
-            if idx < candidate_idx:
-                candidate_pairs.add((idx, candidate_idx))
-    
+    if signatures is None:
+        # Fallback datasketch: dựng lại ma trận SoA từ hashvalues
+        signatures = np.stack(
+            [m.hashvalues for m in minhashes]
+        ).astype(np.uint32)
+
+    bands, rows = _optimal_param(jaccard_threshold, num_perm, 0.5, 0.5)
+    bands_view = signatures[:, :bands * rows].reshape(n_docs, bands, rows)
+
+    band_keys = np.empty((n_docs, bands), dtype=np.uint64)
+    for band_idx in range(bands):
+        band_keys[:, band_idx] = _band_hash(bands_view[:, band_idx, :])
+
+    # Sinh cặp + khử trùng lặp giữa các band: dùng chung _candidate_pairs
+    # (triu_indices + unique trên key uint64) với SimHash
+    cand_i, cand_j = _candidate_pairs(band_keys)
+
     # Bước 4: Kiểm tra chi tiết từng cặp
-    print(f"Bước 3: Xác nhận {len(candidate_pairs)} candidate pairs...")
-    
-    results = []
-    for (i, j) in tqdm(candidate_pairs, desc="   Verify"):
-        jaccard_sim = minhashes[i].jaccard(minhashes[j])
-        
-        if jaccard_sim >= jaccard_threshold:
-            results.append((i, j, jaccard_sim))
-    
+    print(f"Bước 3: Xác nhận {len(cand_i)} candidate pairs...")
+
+    if NUMBA_AVAILABLE and len(cand_i):
+        # Equality-count trên ma trận signature cho MỌI cặp trong một
+        # call native — cùng công thức với MinHash.jaccard
+        sims = _verify_jaccard(signatures, cand_i, cand_j)
+        keep = sims >= jaccard_threshold
+        results = list(zip(
+            cand_i[keep].tolist(), cand_j[keep].tolist(),
+            sims[keep].tolist()
+        ))
+    else:
+        results = []
+        for i, j in tqdm(zip(cand_i.tolist(), cand_j.tolist()),
+                         total=len(cand_i), desc="   Verify"):
+            jaccard_sim = minhashes[i].jaccard(minhashes[j])
+
+            if jaccard_sim >= jaccard_threshold:
+                results.append((i, j, jaccard_sim))
+
+
     # Sắp xếp theo similarity giảm dần
     results.sort(key=lambda x: x[2], reverse=True)
-    
+
     print(f"Tìm được {len(results)} cặp tương tự (ngưỡng: {jaccard_threshold})")
-    return results
+    return as_pairs(results)
 
 if __name__ == "__main__":
     print("="*70)
@@ -131,12 +324,13 @@ if __name__ == "__main__":
             k_shingles=5
         )
         
-        if not duplicates:
+        if not len(duplicates.i):
             print("Không tìm thấy cặp nào trùng lặp ở ngưỡng này.")
             continue
-            
-        print(f"→ Tìm thấy {len(duplicates)} cặp (hiển thị tối đa 10 cặp đầu):\n")
-        for rank, (i, j, sim) in enumerate(duplicates[:10], 1):
+
+        print(f"→ Tìm thấy {len(duplicates.i)} cặp (hiển thị tối đa 10 cặp đầu):\n")
+        for rank, (i, j, sim) in enumerate(
+                zip(duplicates.i[:10], duplicates.j[:10], duplicates.score[:10]), 1):
             print(f"{rank:2d}. [Jaccard ≈ {sim:.3f}] ID {i:2d} ↔ ID {j:2d}")
             print(f"    → \"{test_texts[i]}\"")
             print(f"    → \"{test_texts[j]}\"")
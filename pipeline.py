@@ -0,0 +1,85 @@
+"""
+Module pipeline: chạy cả 3 phương pháp phát hiện trùng lặp trên cùng corpus
+"""
+import json
+
+import numpy as np
+
+try:
+    import orjson
+except ImportError:
+    orjson = None
+
+from faiss_search import find_duplicates_faiss
+from simhash import find_duplicates_simhash
+from minhash import find_duplicates_minhash
+
+
+def _json_default(obj):
+    """Fallback cho stdlib json: đổi numpy scalar/array về kiểu Python"""
+    if isinstance(obj, np.ndarray):
+        return obj.tolist()
+    if isinstance(obj, np.generic):
+        return obj.item()
+    raise TypeError(f"Không serialize được kiểu {type(obj).__name__}")
+
+
+def dumps_result(obj) -> bytes:
+    """
+    Serialize kết quả (stats, clusters summary...) sang JSON bytes
+
+    Dùng orjson khi có: encoder C-level với SIMD string escaping, hiểu
+    trực tiếp numpy int/array nên response lớn của /api/process encode
+    nhanh hơn stdlib json nhiều lần. Flask có thể cắm hàm này vào
+    json provider (app.json.dumps) hoặc trả Response(dumps_result(...)).
+
+    Args:
+        obj: Object JSON-serializable (chấp nhận numpy arrays/scalars)
+
+    Returns:
+        JSON đã encode UTF-8 (bytes)
+    """
+    if orjson is not None:
+        # OPT_NON_STR_KEYS: clusters trả về từ process_clustering /
+        # summarize_clusters key theo int cluster id
+        return orjson.dumps(
+            obj,
+            option=orjson.OPT_SERIALIZE_NUMPY | orjson.OPT_NON_STR_KEYS
+        )
+    return json.dumps(obj, ensure_ascii=False, default=_json_default).encode('utf-8')
+
+
+def find_duplicates_all(texts, embeddings: np.ndarray = None,
+                        model_name: str = 'all-MiniLM-L6-v2') -> dict:
+    """
+    Chạy FAISS + SimHash + MinHash trên cùng một corpus
+
+    Embeddings chỉ được tạo MỘT lần và dùng chung cho FAISS lẫn SimHash;
+    MinHash làm việc trên text thô. Ba method chạy TUẦN TỰ trên main
+    thread: các kernel Numba parallel (_minhash_signatures,
+    _verify_hamming...) dùng threading layer workqueue mặc định, mà
+    launch lần đầu từ worker thread sẽ treo interpreter lúc shutdown —
+    không được đưa chúng vào ThreadPoolExecutor.
+
+    Args:
+        texts: List các văn bản string
+        embeddings: Ma trận embeddings có sẵn (optional); nếu None sẽ tạo
+                    từ texts bằng model_name
+        model_name: Tên model SentenceTransformer khi cần tạo embeddings
+
+    Returns:
+        Dict {'faiss': Pairs, 'simhash': Pairs, 'minhash': Pairs}
+    """
+    if embeddings is None:
+        # Import tại chỗ để dùng pipeline với embeddings có sẵn
+        # mà không cần cài sentence-transformers
+        from embedding import get_embeddings_from_texts
+        embeddings = get_embeddings_from_texts(texts, model_name)
+
+    # copy=True để FAISS không normalize đè lên ma trận của caller
+    # (SimHash còn đọc lại nó ngay sau đó)
+    return {
+        'faiss': find_duplicates_faiss(embeddings, copy=True),
+        'simhash': find_duplicates_simhash(embeddings),
+        'minhash': find_duplicates_minhash(texts),
+    }
@@ -0,0 +1,107 @@
+"""
+Module xuất báo cáo Word cho kết quả loại bỏ trùng lặp
+"""
+from docx import Document
+from docx.shared import Pt, RGBColor
+from docx.enum.style import WD_STYLE_TYPE
+
+
+# Tên các style dùng chung trong báo cáo (tạo một lần, gán lại nhiều lần —
+# rẻ hơn nhiều so với set font.size/font.color trên từng run)
+STYLE_DOC_TEXT = 'DupDoc'
+STYLE_DOC_REP = 'DupDocRep'
+
+
+def _ensure_styles(doc: Document):
+    """Tạo các paragraph style dùng chung nếu chưa có"""
+    styles = doc.styles
+
+    if STYLE_DOC_TEXT not in styles:
+        style = styles.add_style(STYLE_DOC_TEXT, WD_STYLE_TYPE.PARAGRAPH)
+        style.font.size = Pt(10)
+
+    if STYLE_DOC_REP not in styles:
+        style = styles.add_style(STYLE_DOC_REP, WD_STYLE_TYPE.PARAGRAPH)
+        style.font.size = Pt(10)
+        style.font.bold = True
+        style.font.color.rgb = RGBColor(0x1F, 0x7A, 0x1F)
+
+
+def create_deduplication_report(
+    clustering_result: dict,
+    texts: list,
+    output_path: str,
+    method_name: str = ''
+) -> str:
+    """
+    Xuất báo cáo Word cho kết quả phân cụm/loại bỏ trùng lặp
+
+    Mỗi cụm được ghi thành MỘT bảng (id, văn bản) thay vì một Paragraph
+    riêng cho từng văn bản — XML của table cell nông và rẻ hơn nhiều
+    paragraph rời khi số văn bản lên tới hàng nghìn. Font/màu đi qua
+    paragraph style dùng chung thay vì set thuộc tính trên từng run.
+
+    Args:
+        clustering_result: Kết quả từ clustering.process_clustering
+        texts: Danh sách tất cả văn bản
+        output_path: Đường dẫn file .docx đầu ra
+        method_name: Tên phương pháp (FAISS/SimHash/MinHash) cho tiêu đề
+
+    Returns:
+        output_path
+    """
+    doc = Document()
+    _ensure_styles(doc)
+
+    title = 'BÁO CÁO LOẠI BỎ VĂN BẢN TRÙNG LẶP'
+    if method_name:
+        title += f' ({method_name})'
+    doc.add_heading(title, level=0)
+
+    # Bảng thống kê tổng quan
+    stats = clustering_result['stats']
+    doc.add_heading('1. Thống kê', level=1)
+    stats_table = doc.add_table(rows=0, cols=2)
+    stats_table.style = 'Light Grid Accent 1'
+    for label, value in [
+        ('Tổng văn bản', stats['total_docs']),
+        ('Số cụm trùng lặp', stats['n_clusters']),
+        ('Số cặp tương tự', stats['n_pairs']),
+        ('Văn bản bị loại', stats['n_removed']),
+        ('Văn bản giữ lại', stats['n_kept']),
+        ('Tỷ lệ loại', f"{stats['removal_rate']:.1%}"),
+    ]:
+        row = stats_table.add_row().cells
+        row[0].text = label
+        row[1].text = str(value)
+
+    # Chi tiết từng cụm: một bảng (ID, Văn bản) cho mỗi cụm
+    doc.add_heading('2. Các cụm trùng lặp', level=1)
+    for order, (cluster_id, cluster) in enumerate(
+            clustering_result['clusters'].items(), 1):
+        doc.add_heading(
+            f"Cụm {order} ({cluster['size']} văn bản, "
+            f"đại diện: ID {cluster['representative']})",
+            level=2
+        )
+
+        table = doc.add_table(rows=0, cols=2)
+        table.style = 'Table Grid'
+        for doc_info in cluster['documents']:
+            row = table.add_row().cells
+            row[0].text = str(doc_info['id'])
+            paragraph = row[1].paragraphs[0]
+            paragraph.text = doc_info['text']
+            paragraph.style = (
+                STYLE_DOC_REP if doc_info['is_representative'] else STYLE_DOC_TEXT
+            )
+
+    # Danh sách văn bản giữ lại (chỉ ID, text đầy đủ đã nằm trong các cụm)
+    doc.add_heading('3. Văn bản giữ lại', level=1)
+    kept_ids = ', '.join(map(str, clustering_result['kept']))
+    paragraph = doc.add_paragraph(kept_ids)
+    paragraph.style = STYLE_DOC_TEXT
+
+    doc.save(output_path)
+    print(f"Đã xuất báo cáo: {output_path}")
+    return output_path
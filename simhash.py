@@ -1,65 +1,494 @@
 """
 Module tìm kiếm trùng lặp sử dụng SimHash
 """
+import functools
+
 import numpy as np
-from typing import List, Tuple
-import itertools
-from collections import defaultdict
+
+from clustering import Pairs
+
+try:
+    from numba import njit, prange
+    NUMBA_AVAILABLE = True
+except ImportError:
+    NUMBA_AVAILABLE = False
+
+try:
+    import simsimd
+    SIMSIMD_AVAILABLE = True
+except ImportError:
+    SIMSIMD_AVAILABLE = False
+
+# Hằng số SWAR popcount 64-bit
+_SWAR_M1 = np.uint64(0x5555555555555555)
+_SWAR_M2 = np.uint64(0x3333333333333333)
+_SWAR_M4 = np.uint64(0x0F0F0F0F0F0F0F0F)
+_SWAR_H01 = np.uint64(0x0101010101010101)
+
+
+def popcnt64(x: np.ndarray) -> np.ndarray:
+    """
+    Đếm bit 1 trên mảng uint64 bằng SWAR (portable, không cần VPOPCNTQ)
+
+    Chuỗi kinh điển x-((x>>1)&m1) / cộng cặp 2 bit / gộp nibble /
+    nhân 0x0101...>>56 — toàn ufunc NumPy native trên buffer contiguous,
+    8 bit mỗi phép toán ngay cả khi phần cứng không có popcount vector.
+
+    Args:
+        x: Mảng uint64 (mọi shape)
+
+    Returns:
+        Mảng uint64 cùng shape: số bit 1 của từng phần tử
+    """
+    x = x - ((x >> np.uint64(1)) & _SWAR_M1)
+    x = (x & _SWAR_M2) + ((x >> np.uint64(2)) & _SWAR_M2)
+    x = (x + (x >> np.uint64(4))) & _SWAR_M4
+    return (x * _SWAR_H01) >> np.uint64(56)
+
+
+if NUMBA_AVAILABLE:
+    @njit(inline='always')
+    def _popcnt64_scalar(x):
+        """
+        SWAR popcount một lane uint64 — inline vào các kernel verify.
+
+        LLVM nhận ra idiom này và hạ xuống popcntq trên x86 / cnt trên
+        NEON; nơi không có lệnh popcount thì chuỗi SWAR vẫn chạy đúng.
+        """
+        x = x - ((x >> 1) & 0x5555555555555555)
+        x = (x & 0x3333333333333333) + ((x >> 2) & 0x3333333333333333)
+        x = (x + (x >> 4)) & 0x0F0F0F0F0F0F0F0F
+        return (x * 0x0101010101010101) >> 56
+
+    @njit(parallel=True, fastmath=True, cache=True)
+    def _verify_hamming_128(hashes, pairs_i, pairs_j):
+        """
+        Bản đặc biệt hoá cho signature 128 bit: đúng 2 lane uint64/doc
+
+        Inner loop unroll hẳn thành 2 cặp XOR+popcount branch-free —
+        compiler phát ra 2 lệnh popcount liền nhau thay vì vòng W lane.
+        """
+        n_pairs = len(pairs_i)
+        out = np.empty(n_pairs, dtype=np.int32)
+
+        for p in prange(n_pairs):
+            i = pairs_i[p]
+            j = pairs_j[p]
+            out[p] = (_popcnt64_scalar(hashes[i, 0] ^ hashes[j, 0])
+                      + _popcnt64_scalar(hashes[i, 1] ^ hashes[j, 1]))
+
+        return out
+
+    @njit(parallel=True, fastmath=True, cache=True)
+    def _verify_hamming(hashes, pairs_i, pairs_j):
+        """
+        Tính Hamming distance cho cả mảng candidate pairs trong native code
+
+        XOR + popcount SWAR trên từng lane uint64, prange song song theo
+        cặp — không còn dispatch ufunc Python cho từng candidate.
+        """
+        n_pairs = len(pairs_i)
+        n_lanes = hashes.shape[1]
+        out = np.empty(n_pairs, dtype=np.int32)
+
+        for p in prange(n_pairs):
+            dist = 0
+            for w in range(n_lanes):
+                dist += _popcnt64_scalar(
+                    hashes[pairs_i[p], w] ^ hashes[pairs_j[p], w]
+                )
+            out[p] = dist
+
+        return out
+
+
+def pack_bits(bits: np.ndarray) -> np.ndarray:
+    """
+    Nén ma trận bit (n, nbits) uint8 0/1 thành (n, nbits//64) uint64
+
+    nbits được pad lên bội của 64 bằng bit 0 (không ảnh hưởng Hamming:
+    XOR của các bit pad giống nhau luôn bằng 0). Thứ tự byte trong mỗi
+    lane theo endianness máy — XOR + popcount không phụ thuộc thứ tự bit.
+
+    Args:
+        bits: Ma trận bit 0/1 dtype uint8, shape (n, nbits)
+
+    Returns:
+        Ma trận uint64 shape (n, ceil(nbits/64))
+    """
+    pad = (-bits.shape[1]) % 64
+    if pad:
+        bits = np.pad(bits, ((0, 0), (0, pad)))
+    return np.packbits(bits, axis=1, bitorder='big').view(np.uint64)
+
+
+def band_keys_from_bits(bits: np.ndarray, bands: int) -> np.ndarray:
+    """
+    Tính key LSH cho từng band bằng bitpacking vector hoá
+
+    Thay cho int(''.join(map(str, band_bits)), 2) từng doc từng band
+    (O(n_docs * bands * band_width) thao tác string trong Python):
+    pack toàn bộ ma trận bit một lần bằng np.packbits rồi view mỗi band
+    thành một uint64.
+
+    Args:
+        bits: Ma trận bit (n_docs, nbits) uint8 0/1
+        bands: Số band; nbits phải chia hết cho bands
+
+    Returns:
+        Ma trận key (n_docs, bands) uint64
+    """
+    n_docs, nbits = bits.shape
+    band_width = nbits // bands
+    if band_width > 64:
+        raise ValueError(f"band_width {band_width} > 64 không vừa key uint64")
+
+    band_bits = bits.reshape(n_docs, bands, band_width)
+
+    # Pad mỗi band lên 64 bit để mỗi key chiếm đúng 8 byte
+    pad = (-band_width) % 64
+    if pad:
+        band_bits = np.pad(band_bits, ((0, 0), (0, 0), (0, pad)))
+
+    packed = np.packbits(band_bits, axis=2, bitorder='big')  # (n, bands, 8)
+    return packed.view(np.uint64).reshape(n_docs, bands)
+
+
+def _condense_keys_128(band_keys: np.ndarray) -> np.ndarray:
+    """
+    Gộp 8 band key 16-bit thành signature (n, 2) uint64 cho verify_128
+
+    Với cấu hình mặc định nbits=128 / bands=8, mỗi key chỉ dùng 16 bit
+    thấp (cả đường packbits lẫn đường torch đều bảo đảm thế), nên 4 key
+    OR-shift vào các field rời nhau của một lane — XOR/Hamming bảo toàn.
+
+    Args:
+        band_keys: Ma trận key (n, 8) uint64, mỗi key < 2^16
+
+    Returns:
+        Ma trận (n, 2) uint64 contiguous
+    """
+    condensed = np.empty((len(band_keys), 2), dtype=np.uint64)
+    for half in range(2):
+        cols = band_keys[:, half * 4:(half + 1) * 4]
+        condensed[:, half] = (
+            cols[:, 0]
+            | cols[:, 1] << np.uint64(16)
+            | cols[:, 2] << np.uint64(32)
+            | cols[:, 3] << np.uint64(48)
+        )
+    return condensed
+
+
+def _candidate_pairs(band_keys: np.ndarray):
+    """
+    Sinh candidate pairs (i < j) từ ma trận band key, khử trùng lặp
+    giữa các band bằng np.unique
+
+    Mỗi bucket cỡ k sinh cặp bằng np.triu_indices thay cho
+    itertools.combinations (O(k^2) tuple + set.add trong Python); mỗi cặp
+    đóng gói thành một uint64 (i << 32 | j) nên dedup toàn cục chỉ là một
+    lần np.unique trên mảng 1-D.
+
+    Args:
+        band_keys: Ma trận key (n_docs, bands) uint64
+
+    Returns:
+        (cand_i, cand_j): 2 mảng int64 song song, i < j, đã khử trùng lặp
+    """
+    # Chuyển sang (bands, n_docs) contiguous: mỗi lần argsort đọc key
+    # của band liền mạch thay vì stride 8*bands byte qua ma trận row-major
+    band_cols = np.ascontiguousarray(band_keys.T)
+
+    all_pairs = []
+    for band_idx in range(band_cols.shape[0]):
+        for bucket in _band_buckets(band_cols[band_idx]):
+            # bucket tăng dần theo doc_id nên iu < ju ứng với i < j
+            iu, ju = np.triu_indices(len(bucket), 1)
+            all_pairs.append(
+                bucket[iu].astype(np.uint64) << np.uint64(32)
+                | bucket[ju].astype(np.uint64)
+            )
+
+    if not all_pairs:
+        empty = np.empty(0, dtype=np.int64)
+        return empty, empty
+
+    packed = np.unique(np.concatenate(all_pairs))
+    cand_i = (packed >> np.uint64(32)).astype(np.int64)
+    cand_j = (packed & np.uint64(0xFFFFFFFF)).astype(np.int64)
+    return cand_i, cand_j
+
+
+@functools.lru_cache(maxsize=8)
+def _make_planes(dim: int, nbits: int, seed: int):
+    """
+    Sinh (và cache) hyperplanes đã normalize cho một cấu hình hasher
+
+    find_duplicates_simhash dựng SimHasher mới mỗi lần gọi; LRU cache
+    theo (dim, nbits, seed) bỏ qua nbits*dim lần RNG + một pass normalize
+    ở các lần gọi lặp lại cùng shape. Trả kèm bản transpose C-contiguous
+    để np.dot đi thẳng đường BLAS contiguous, không transpose lại mỗi lần.
+
+    Returns:
+        (planes (nbits, dim) float32, planes_t (dim, nbits) float32)
+    """
+    rng = np.random.default_rng(seed)
+    planes = rng.standard_normal((nbits, dim)).astype(np.float32)
+    planes /= np.linalg.norm(planes, axis=1, keepdims=True) + 1e-8
+    return planes, np.ascontiguousarray(planes.T)
+
+
+def _band_buckets(keys: np.ndarray):
+    """
+    Duyệt các bucket LSH (>= 2 phần tử) của một band bằng numpy groupby
+
+    Sort doc id theo key rồi quét biên nhóm — thay cho defaultdict(list)
+    với một lần dict lookup + append cho từng doc.
+
+    Args:
+        keys: Mảng key (n_docs,) uint64 của band
+
+    Yields:
+        Mảng doc_id (tăng dần) của từng bucket có >= 2 văn bản
+    """
+    order = np.argsort(keys, kind='stable')
+    sorted_keys = keys[order]
+    edges = np.r_[
+        0, 1 + np.flatnonzero(sorted_keys[1:] != sorted_keys[:-1]), len(keys)
+    ]
+    for start, end in zip(edges[:-1], edges[1:]):
+        if end - start >= 2:
+            yield order[start:end]
 
 
 class SimHasher:
     """SimHash dựa trên embedding vectors"""
     
-    def __init__(self, dim: int, nbits: int = 128, seed: int = 42):
+    def __init__(self, dim: int, nbits: int = 128, seed: int = 42,
+                 use_int8: bool = False):
         """
         Khởi tạo SimHasher
-        
+
         Args:
             dim: Chiều embedding vector
             nbits: Số bit của SimHash (mặc định 128)
             seed: Random seed
+            use_int8: Quantize planes + embeddings về int8 và tính dot
+                      bằng GEMM int8 (4x ít bandwidth vào planes; sign
+                      không đổi theo scale dương, chỉ các dot sát 0 có
+                      thể lật bit — chấp nhận được vì SimHash vốn xấp xỉ)
         """
         self.dim = dim
         self.nbits = nbits
         self.seed = seed
-        
-        np.random.seed(seed)
-        
-        # Tạo random hyperplanes cho mỗi bit
-        self.planes = np.random.randn(nbits, dim).astype(np.float32)
-        self.planes = self.planes / (np.linalg.norm(self.planes, axis=1, keepdims=True) + 1e-8)
-        
+        self.use_int8 = use_int8
+
+        # Hyperplanes lấy từ cache module-level (kèm bản transpose
+        # contiguous cho đường GEMM) — KHÔNG được mutate in-place
+        self.planes, self.planes_t = _make_planes(dim, nbits, seed)
+
+        # Bản torch của planes_t, tạo lazy ở lần hash_bands_torch đầu
+        self._planes_torch = None
+
+        if use_int8:
+            # Planes đã normalize nên |giá trị| <= 1: scale thẳng lên 127
+            self.planes_i8 = np.clip(
+                np.round(self.planes * 127), -128, 127
+            ).astype(np.int8)
+
         print(f"✓ SimHash: {nbits} bits, dim={dim}")
     
-    def hash(self, embeddings: np.ndarray) -> np.ndarray:
+    def hash_bits(self, embeddings: np.ndarray) -> np.ndarray:
         """
-        Tính SimHash cho mảng embeddings
-        
+        Tính SimHash dạng ma trận bit 0/1 (chưa nén)
+
         Args:
             embeddings: shape (n, dim) - float32
-        
+
         Returns:
-            shape (n, nbits) - binary array
+            shape (n, nbits) - binary array uint8
         """
         if embeddings.ndim == 1:
             embeddings = embeddings.reshape(1, -1)
-        
+
         n, d = embeddings.shape
         if d != self.dim:
             raise ValueError(f"Chiều mismatch: {d} != {self.dim}")
-        
-        # Dot product với hyperplanes
-        dots = np.dot(embeddings.astype(np.float32), self.planes.T)  # (n, nbits)
-        
+
+        if self.use_int8:
+            # Quantize embeddings per-row về int8; sign của dot bất biến
+            # theo scale dương nên không cần dequantize trước khi lấy bit
+            scale = np.abs(embeddings).max(axis=1, keepdims=True)
+            scale[scale == 0] = 1.0
+            emb_i8 = np.clip(
+                np.round(embeddings * (127.0 / scale)), -128, 127
+            ).astype(np.int8)
+            dots = np.matmul(emb_i8, self.planes_i8.T, dtype=np.int32)
+        else:
+            # Chỉ copy khi dtype/layout chưa đúng — trường hợp thường gặp
+            # (float32 contiguous từ TextEmbedder) đi thẳng vào GEMM
+            if (embeddings.dtype != np.float32
+                    or not embeddings.flags['C_CONTIGUOUS']):
+                embeddings = np.ascontiguousarray(embeddings, dtype=np.float32)
+            # Dot product với hyperplanes (planes_t đã contiguous)
+            dots = np.dot(embeddings, self.planes_t)  # (n, nbits)
+
         # Convert to bits
         bits = (dots > 0).astype(np.uint8)  # (n, nbits)
-        
+
         return bits
-    
+
+    def hash_bands(self, embeddings: np.ndarray, bands: int) -> np.ndarray:
+        """
+        Fuse hash + band key: tính dots và pack key theo TỪNG band
+
+        Không materialize ma trận bit (n, nbits) trung gian rồi đọc lại —
+        tiết kiệm một lượt ghi + đọc n*nbits byte qua DRAM. Ma trận key
+        trả về đồng thời là signature đầy đủ: các bit pad 0 của từng band
+        giống nhau giữa mọi doc nên triệt tiêu trong XOR khi tính Hamming.
+
+        Args:
+            embeddings: shape (n, dim) - float32
+            bands: Số band; nbits phải chia hết cho bands, band_width <= 64
+
+        Returns:
+            Ma trận key (n, bands) uint64
+        """
+        if embeddings.ndim == 1:
+            embeddings = embeddings.reshape(1, -1)
+
+        n, d = embeddings.shape
+        if d != self.dim:
+            raise ValueError(f"Chiều mismatch: {d} != {self.dim}")
+
+        band_width = self.nbits // bands
+        if band_width * bands != self.nbits:
+            raise ValueError(f"nbits {self.nbits} không chia hết cho {bands} bands")
+        if band_width > 64:
+            raise ValueError(f"band_width {band_width} > 64 không vừa key uint64")
+
+        if self.use_int8:
+            scale = np.abs(embeddings).max(axis=1, keepdims=True)
+            scale[scale == 0] = 1.0
+            emb = np.clip(
+                np.round(embeddings * (127.0 / scale)), -128, 127
+            ).astype(np.int8)
+            planes_banded = self.planes_i8.reshape(bands, band_width, self.dim)
+        else:
+            if (embeddings.dtype != np.float32
+                    or not embeddings.flags['C_CONTIGUOUS']):
+                embeddings = np.ascontiguousarray(embeddings, dtype=np.float32)
+            emb = embeddings
+            planes_banded = None
+
+        pad = (-band_width) % 64
+        keys = np.empty((n, bands), dtype=np.uint64)
+
+        for band_idx in range(bands):
+            if self.use_int8:
+                dots_b = np.matmul(emb, planes_banded[band_idx].T, dtype=np.int32)
+            else:
+                # Lát cột của planes_t: không cần transpose lại mỗi band
+                start = band_idx * band_width
+                dots_b = emb @ self.planes_t[:, start:start + band_width]
+
+            bits_b = (dots_b > 0).astype(np.uint8)
+            if pad:
+                bits_b = np.pad(bits_b, ((0, 0), (0, pad)))
+            keys[:, band_idx] = np.packbits(
+                bits_b, axis=1, bitorder='big'
+            ).view(np.uint64).ravel()
+
+        return keys
+
+    def hash_bands_torch(self, emb_t, bands: int) -> np.ndarray:
+        """
+        Như hash_bands nhưng GEMM chạy bằng torch trên device của emb_t
+
+        Khi embeddings đã nằm sẵn trên GPU (TextEmbedder), tính
+        emb @ planes.T bằng cuBLAS/Tensor Core rồi mới copy KEY (n*bands
+        uint64) về host — tránh roundtrip cả ma trận embedding về CPU.
+
+        Key ở đây là giá trị nguyên của band bits (bit cao nhất = bit
+        đầu band) nên XOR hai key vẫn cho đúng Hamming giữa hai band —
+        dùng được đồng thời làm LSH key lẫn signature, như hash_bands.
+        Lưu ý encoding khác hash_bands (không pad-rồi-view theo
+        endianness) nên không trộn key của hai đường trong cùng một lần.
+
+        Args:
+            emb_t: torch.Tensor (n, dim) trên CPU hoặc CUDA
+            bands: Số band; nbits phải chia hết cho bands, band_width <= 64
+
+        Returns:
+            Ma trận key (n, bands) uint64 (numpy, trên host)
+        """
+        import torch
+
+        n, d = emb_t.shape
+        if d != self.dim:
+            raise ValueError(f"Chiều mismatch: {d} != {self.dim}")
+
+        band_width = self.nbits // bands
+        if band_width * bands != self.nbits:
+            raise ValueError(f"nbits {self.nbits} không chia hết cho {bands} bands")
+        if band_width > 64:
+            raise ValueError(f"band_width {band_width} > 64 không vừa key uint64")
+
+        planes_t = self._planes_torch
+        if (planes_t is None or planes_t.device != emb_t.device
+                or planes_t.dtype != emb_t.dtype):
+            planes_t = torch.from_numpy(self.planes_t).to(
+                device=emb_t.device, dtype=emb_t.dtype
+            )
+            self._planes_torch = planes_t
+
+        signs = (emb_t @ planes_t) > 0  # (n, nbits) bool, trên device
+
+        # Pack bit -> int64 bằng bitshift reduction (torch không có
+        # packbits): bit đầu band ở vị trí cao nhất
+        shifts = torch.arange(
+            band_width - 1, -1, -1, device=emb_t.device, dtype=torch.int64
+        )
+        weights = torch.ones_like(shifts) << shifts
+        keys = (signs.reshape(n, bands, band_width).to(torch.int64)
+                * weights).sum(-1)
+
+        return keys.cpu().numpy().view(np.uint64)
+
+    def hash(self, embeddings: np.ndarray) -> np.ndarray:
+        """
+        Tính SimHash nén thành các lane uint64 (8x ít bộ nhớ hơn uint8/bit)
+
+        Args:
+            embeddings: shape (n, dim) - float32
+
+        Returns:
+            shape (n, ceil(nbits/64)) - uint64
+        """
+        return pack_bits(self.hash_bits(embeddings))
+
     @staticmethod
     def hamming_distance(hash1: np.ndarray, hash2: np.ndarray) -> int:
-        """Tính Hamming distance giữa 2 hash vectors"""
-        return np.count_nonzero(hash1 != hash2)
+        """
+        Tính Hamming distance giữa 2 hash đã nén uint64
+
+        Khi có simsimd thì dispatch thẳng vào kernel XOR+POPCNT SIMD
+        (AVX-512 VPOPCNTQ / NEON CNT); fallback là XOR rồi SWAR popcount
+        vector hoá trên từng lane uint64 (popcnt64).
+
+        Nhận cả ma trận bit 0/1 uint8 chưa nén (đầu ra hash_bits) cho
+        caller chưa chuyển sang packed uint64.
+        """
+        if hash1.dtype == np.uint8:
+            # Bit 0/1 mỗi byte: XOR rồi sum MỘT pass — không materialize
+            # temporary bool cỡ nbits như count_nonzero(h1 != h2)
+            return int(np.bitwise_xor(hash1, hash2).sum(dtype=np.int32))
+        if SIMSIMD_AVAILABLE:
+            return int(simsimd.hamming(
+                hash1.view(np.uint8), hash2.view(np.uint8), dtype='bin8'
+            ))
+        return int(popcnt64(np.bitwise_xor(hash1, hash2)).sum())
 
 
 def find_duplicates_simhash(
@@ -67,16 +496,17 @@ def find_duplicates_simhash(
     nbits: int = 128,
     bands: int = 8,
     hamming_threshold: int = 20
-) -> List[Tuple[int, int, int]]:
+) -> Pairs:
     """
     Tìm các cặp văn bản tương tự sử dụng SimHash
     Args:
-        embeddings: numpy array shape (n_docs, embedding_dim) - float32
+        embeddings: numpy array shape (n_docs, embedding_dim) - float32,
+                    hoặc torch.Tensor (GEMM chạy ngay trên device của nó)
         nbits: Số bit của SimHash
         bands: Số band cho LSH (mặc định 8)
         hamming_threshold: Ngưỡng Hamming distance
     Returns:
-        List các tuple (doc_id_1, doc_id_2, hamming_distance)
+        Pairs (i int32, j int32, score int32 = hamming_distance)
     """
     
     n_docs, embedding_dim = embeddings.shape
@@ -85,48 +515,59 @@ def find_duplicates_simhash(
     # Tạo hasher
     hasher = SimHasher(dim=embedding_dim, nbits=nbits, seed=42)
     
-    # Hash toàn bộ embeddings
-    print("Bước 1: Hash embeddings...")
-    hashes = hasher.hash(embeddings.astype(np.float32))  # (n_docs, nbits)
-    
-    # LSH với bands
-    print("Bước 2: LSH indexing...")
-    band_width = nbits // bands
-    hash_tables = [defaultdict(list) for _ in range(bands)]
-    
-    for doc_id in range(n_docs):
-        hash_vec = hashes[doc_id]
-        for band_idx in range(bands):
-            # Lấy bits của band này
-            band_bits = hash_vec[band_idx * band_width:(band_idx + 1) * band_width]
-            # Convert to integer
-            band_hash = int(''.join(map(str, band_bits)), 2)
-            hash_tables[band_idx][band_hash].append(doc_id)
-    
-    # Lấy candidate pairs từ LSH
+    # Hash + band key trong MỘT pass: không còn ma trận bit trung gian.
+    # band_keys đồng thời là signature nén cho bước verify (pad 0 mỗi band
+    # triệt tiêu trong XOR nên Hamming không đổi)
+    print("Bước 1+2: Hash embeddings + LSH keys (fused)...")
+    if isinstance(embeddings, np.ndarray):
+        # hash_bands tự cast khi cần — không astype thừa ở đây nữa
+        band_keys = hasher.hash_bands(embeddings, bands)
+    else:
+        # torch.Tensor: GEMM ngay trên device của embeddings (GPU nếu
+        # embedding vừa tạo ở đó), chỉ copy key về host
+        band_keys = hasher.hash_bands_torch(embeddings, bands)
+    hashes = band_keys
+
+    # Lấy candidate pairs: groupby từng band bằng argsort rồi triu_indices
+    # + unique trên key uint64 — không còn set/tuple Python nào
     print("Bước 3: Finding candidates...")
-    candidate_pairs = set()
-    for band_table in hash_tables:
-        for bucket in band_table.values():
-            if len(bucket) > 1:
-                for pair in itertools.combinations(bucket, 2):
-                    candidate_pairs.add(tuple(sorted(pair)))
-    
+    cand_i, cand_j = _candidate_pairs(band_keys)
+
     # Xác nhận từng cặp
-    print(f"Bước 4: Verifying {len(candidate_pairs)} candidates...")
-    results = []
-    
-    for i, j in candidate_pairs:
-        hamming_dist = SimHasher.hamming_distance(hashes[i], hashes[j])
-        
-        if hamming_dist <= hamming_threshold:
-            results.append((i, j, hamming_dist))
+    print(f"Bước 4: Verifying {len(cand_i)} candidates...")
+    if NUMBA_AVAILABLE and len(cand_i):
+        # JIT: XOR + popcount toàn bộ candidates trong một call native,
+        # nhận thẳng 2 mảng SoA từ bước sinh cặp
+        if nbits == 128 and bands == 8:
+            # Cấu hình mặc định: nén về 2 lane uint64/doc, verify unroll
+            dists = _verify_hamming_128(
+                _condense_keys_128(hashes), cand_i, cand_j
+            )
+        else:
+            dists = _verify_hamming(hashes, cand_i, cand_j)
+        keep = dists <= hamming_threshold
+        results = list(zip(
+            cand_i[keep].tolist(), cand_j[keep].tolist(),
+            dists[keep].tolist()
+        ))
+    else:
+        results = []
+        for i, j in zip(cand_i.tolist(), cand_j.tolist()):
+            hamming_dist = SimHasher.hamming_distance(hashes[i], hashes[j])
+
+            if hamming_dist <= hamming_threshold:
+                results.append((i, j, hamming_dist))
     
     # Sắp xếp theo Hamming distance tăng dần
     results.sort(key=lambda x: x[2])
-    
+
     print(f"Tìm được {len(results)} cặp tương tự (ngưỡng Hamming: {hamming_threshold})")
-    return results
+    n_results = len(results)
+    return Pairs(
+        i=np.fromiter((r[0] for r in results), dtype=np.int32, count=n_results),
+        j=np.fromiter((r[1] for r in results), dtype=np.int32, count=n_results),
+        score=np.fromiter((r[2] for r in results), dtype=np.int32, count=n_results),
+    )
 
 if __name__ == "__main__":
     from embedding import get_embeddings_from_texts
@@ -166,8 +607,9 @@ if __name__ == "__main__":
             hamming_threshold=th
         )
         
-        if duplicates:
-            for i, j, dist in duplicates[:10]:  # chỉ hiện tối đa 10 cặp
+        if len(duplicates.i):
+            # chỉ hiện tối đa 10 cặp
+            for i, j, dist in zip(duplicates.i[:10], duplicates.j[:10], duplicates.score[:10]):
                 print(f"[{dist:2d}] ID {i:2d} ↔ ID {j:2d}")
                 print(f"     → \"{test_texts[i]}\"")
                 print(f"     → \"{test_texts[j]}\"")
@@ -0,0 +1,90 @@
+"""
+Module tiện ích đọc danh sách văn bản từ file (.txt, .csv, .docx)
+"""
+import csv
+import os
+from io import TextIOWrapper
+from typing import List
+
+# Chặn file quá lớn trước khi đọc (bytes)
+MAX_FILE_BYTES = 50 * 1024 * 1024
+
+
+def _file_size(stream) -> int:
+    """Lấy kích thước stream (bytes) rồi seek về đầu"""
+    stream.seek(0, os.SEEK_END)
+    size = stream.tell()
+    stream.seek(0)
+    return size
+
+
+def extract_text_from_file(file, filename: str = None,
+                           max_bytes: int = MAX_FILE_BYTES) -> List[str]:
+    """
+    Đọc danh sách văn bản từ file upload hoặc đường dẫn
+
+    Với .txt/.csv: stream từng dòng qua TextIOWrapper thay vì
+    file.read() cả file — không decode cả file thành một string trung
+    gian (~2x kích thước file) rồi mới split. Với .docx: python-docx
+    nhận thẳng file-like, không cần bọc BytesIO(file.read()).
+
+    Args:
+        file: Đường dẫn file, file-like nhị phân, hoặc object upload có
+              thuộc tính .stream (vd FileStorage của Flask)
+        filename: Tên file để lấy đuôi; mặc định lấy từ file
+        max_bytes: Chặn file lớn hơn ngưỡng này TRƯỚC khi đọc nội dung
+
+    Returns:
+        List văn bản (mỗi dòng .txt / mỗi dòng cột đầu .csv /
+        mỗi paragraph .docx không rỗng)
+
+    Raises:
+        ValueError: File quá lớn hoặc đuôi không hỗ trợ
+    """
+    if filename is None:
+        filename = getattr(file, 'filename', None) or str(file)
+    ext = os.path.splitext(filename)[1].lower()
+
+    # Upload object (Flask FileStorage) -> stream nhị phân bên dưới
+    stream = getattr(file, 'stream', file)
+
+    owns_stream = isinstance(stream, (str, os.PathLike))
+    if owns_stream:
+        if os.path.getsize(stream) > max_bytes:
+            raise ValueError(f"File quá lớn (> {max_bytes} bytes)")
+        stream = open(stream, 'rb')
+    elif _file_size(stream) > max_bytes:
+        raise ValueError(f"File quá lớn (> {max_bytes} bytes)")
+
+    try:
+        if ext == '.txt':
+            # Stream từng dòng, không materialize cả file
+            wrapper = TextIOWrapper(stream, encoding='utf-8',
+                                    errors='ignore', newline='')
+            texts = [line.strip() for line in wrapper if line.strip()]
+            wrapper.detach()
+            return texts
+
+        if ext == '.csv':
+            wrapper = TextIOWrapper(stream, encoding='utf-8',
+                                    errors='ignore', newline='')
+            texts = [
+                row[0].strip() for row in csv.reader(wrapper)
+                if row and row[0].strip()
+            ]
+            wrapper.detach()
+            return texts
+
+        if ext == '.docx':
+            from docx import Document
+            document = Document(stream)
+            return [
+                paragraph.text.strip()
+                for paragraph in document.paragraphs
+                if paragraph.text.strip()
+            ]
+
+        raise ValueError(f"Định dạng không hỗ trợ: {ext}")
+    finally:
+        if owns_stream:
+            stream.close()